@@ -0,0 +1,66 @@
+"""
+Check CPU.runFast against the pipelined CPU.cycle() path.
+
+For each source file and forwarding mode, a fresh CPU is run with runFast, and another
+is cycled until it has retired the same number of instructions. Both must end with the
+same registers. Programs that loop forever are compared after a fixed instruction budget.
+
+Usage: python check_runfast.py [src...]   (defaults to examples/*.s)
+"""
+import sys
+import glob
+from ir import MIPSRegister
+from mips_parser import Parser
+from cpu import CPU
+from logger import EV_EXIT
+
+# Instructions runFast may execute before the run is cut off
+MAX_STEPS = 5000
+# Cycles the pipeline may take per retired instruction before giving up
+MAX_CPI = 10
+
+
+def checkProgram(srcFile: str, forwarding: bool) -> bool:
+    """Compare both paths on one source file (True if they agree)."""
+    with open(srcFile, 'r') as f:
+        nodes = Parser(f).parse()
+
+    fast = CPU(nodes, forwarding=forwarding)
+    steps = fast.runFast(MAX_STEPS)
+
+    slow = CPU(nodes, forwarding=forwarding)
+    retired = 0
+    cycles = 0
+    while slow.running and retired < steps and cycles < steps * MAX_CPI:
+        for record in slow.cycle():
+            if record[0] == EV_EXIT:
+                retired += 1
+        cycles += 1
+
+    mismatches = [
+        f'{reg!s}: runFast={fast.register(reg)} cycle={slow.register(reg)}'
+        for reg in map(MIPSRegister, range(MIPSRegister.PC))
+        if fast.register(reg) != slow.register(reg)
+    ]
+    if retired != steps:
+        mismatches.insert(0, f'retired {retired} instructions in {cycles} cycles, runFast ran {steps}')
+    elif fast.running != slow.running:
+        mismatches.insert(0, f'running: runFast={fast.running} cycle={slow.running}')
+
+    mode = 'forwarding' if forwarding else 'no forwarding'
+    if mismatches:
+        print(f'FAIL {srcFile} ({mode})')
+        for line in mismatches:
+            print(f'    {line}')
+        return False
+    print(f'ok   {srcFile} ({mode}, {steps} instructions)')
+    return True
+
+
+def main(srcFiles) -> int:
+    results = [checkProgram(srcFile, forwarding) for srcFile in srcFiles for forwarding in (True, False)]
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    exit(main(sys.argv[1:] or sorted(glob.glob('examples/*.s'))))
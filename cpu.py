@@ -1,76 +1,194 @@
 """Contains stuff to emulate a MIPS CPU with 5-stage pipeline."""
-from ir import MIPSInstruction, MIPSRegister, Node
-from typing import Dict, List, Optional, Tuple, Iterable
-from logger import LogEvent, PipelineStallEvent, PipelineExitEvent, StageAdvanceEvent, InstructionFetchEvent, ExId, EndOfCycleEvent
-
-
-class PipelineContext(object):
-    """Used for data stored in each stage of the pipeline."""
-
-    def __init__(self, exId: ExId, node: Node):
-        self.exId = exId
-        self.node = node
+import operator
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from ir import MIPSInstruction, MIPSRegister, Node, NUM_REGISTERS
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Iterator
+from logger import EventRecord, ExId, EV_FETCH, EV_STALL, EV_ADVANCE, EV_EXIT, EV_EOC, STAGE_IF, STAGE_ID, STAGE_EX, STAGE_MEM, STAGE_WB, STAGE_FLUSH, STAGE_NAMES
+
+
+# Instruction category flags, precomputed per instruction at decode time
+FLAG_ARITH = 1 << 0
+FLAG_IMM = 1 << 1
+FLAG_BRANCH = 1 << 2
+# Categories that write to rd
+FLAG_WRITES_RD = FLAG_ARITH | FLAG_IMM
+
+
+def _instructionFlags(inst: MIPSInstruction) -> int:
+    """Compute category flags for an instruction."""
+    return (inst.isArithmetic << 0) | (inst.isImmediate << 1) | (inst.isBranch << 2)
+
+
+# Category flags for each instruction, indexed by MIPSInstruction
+_INST_FLAGS: List[int] = [_instructionFlags(inst) for inst in MIPSInstruction]
+
+
+# How EX fetches an instruction's operands, precomputed per instruction at decode time
+INPUT_NONE = 0     # No operands (nop)
+INPUT_IMM = 1      # rs, immediate
+INPUT_REG_REG = 2  # rs, rt
+
+
+def _inputMode(inst: MIPSInstruction) -> int:
+    """Compute EX operand mode for an instruction."""
+    if inst == MIPSInstruction.NOP:
+        return INPUT_NONE
+    elif inst.isImmediate:
+        return INPUT_IMM
+    else:
+        return INPUT_REG_REG
+
+
+# EX operand mode for each instruction, indexed by MIPSInstruction
+_INPUT_MODE: List[int] = [_inputMode(inst) for inst in MIPSInstruction]
+
+
+# EX stage operation for each instruction, indexed by MIPSInstruction (nop gives 0).
+# Immediate forms share their register form's operation, as EX is handed the
+# already-selected second operand.
+_EX_TABLE: List[Callable[[int, int], int]] = [lambda rS, rT: 0] * len(MIPSInstruction)
+_EX_TABLE[MIPSInstruction.ADD] = _EX_TABLE[MIPSInstruction.ADDI] = operator.add
+_EX_TABLE[MIPSInstruction.AND] = _EX_TABLE[MIPSInstruction.ANDI] = operator.and_
+_EX_TABLE[MIPSInstruction.OR] = _EX_TABLE[MIPSInstruction.ORI] = operator.or_
+_EX_TABLE[MIPSInstruction.SLT] = _EX_TABLE[MIPSInstruction.SLTI] = lambda rS, rT: 1 if (rS < rT) else 0
+_EX_TABLE[MIPSInstruction.BEQ] = lambda rS, rT: 1 if (rS == rT) else 0
+_EX_TABLE[MIPSInstruction.BNE] = lambda rS, rT: 1 if (rS != rT) else 0
+
+# Python expression for each instruction's operation, used by _compileBlocks
+_BLOCK_EXPR: Dict[MIPSInstruction, str] = {
+    MIPSInstruction.ADD: '{rs} + {rt}',
+    MIPSInstruction.AND: '{rs} & {rt}',
+    MIPSInstruction.OR: '{rs} | {rt}',
+    MIPSInstruction.SLT: '1 if {rs} < {rt} else 0',
+    MIPSInstruction.BEQ: '{rs} == {rt}',
+    MIPSInstruction.BNE: '{rs} != {rt}',
+}
+_BLOCK_EXPR[MIPSInstruction.ADDI] = _BLOCK_EXPR[MIPSInstruction.ADD]
+_BLOCK_EXPR[MIPSInstruction.ANDI] = _BLOCK_EXPR[MIPSInstruction.AND]
+_BLOCK_EXPR[MIPSInstruction.ORI] = _BLOCK_EXPR[MIPSInstruction.OR]
+_BLOCK_EXPR[MIPSInstruction.SLTI] = _BLOCK_EXPR[MIPSInstruction.SLT]
+
+
+def _compileBlocks(src: List[Node], targetIdx: List[Optional[int]], entry: int = 0) -> List[Optional[Tuple[Callable[[List[int]], int], int]]]:
+    """
+    Compile a program's basic blocks into Python functions.
 
+    Each block function takes the register list, applies every instruction in
+    the block to it, and returns the index of the next instruction to run.
 
-IFContext = PipelineContext
+    Parameters
+    ----------
+    src: List[Node]
+        Source instruction list
+    targetIdx: List[Optional[int]]
+        Resolved branch target of each instruction
+    entry: int
+        Index of the first instruction to be run
+    
+    Returns
+    -------
+    List[Optional[Tuple[Callable[[List[int]], int], int]]]
+        (block function, instruction count) for each instruction index that starts
+        a block, None for the rest
+    
+    """
+    # Blocks start at the program entry, at branch targets, and after branches
+    leaders = {0, entry}
+    for i, node in enumerate(src):
+        if node.inst.isBranch:
+            leaders.add(targetIdx[i])
+            leaders.add(i + 1)
+    
+    table: List[Optional[Tuple[Callable[[List[int]], int], int]]] = [None] * len(src)
+    for start in sorted(leader for leader in leaders if leader < len(src)):
+        lines = ['def block(r):']
+        end = start
+        while True:
+            node = src[end]
+            end += 1
+            if node.inst != MIPSInstruction.NOP:
+                expr = _BLOCK_EXPR.get(node.inst)
+                if expr is None:
+                    raise ValueError(f'Unable to compile instruction: {node}')
+                rs = f'r[{int(node.rs)}]'
+                rt = str(node.immediate) if node.inst.isImmediate else f'r[{int(node.rt)}]'
+                expr = expr.format(rs=rs, rt=rt)
+                if node.inst.isBranch:
+                    lines.append(f'    return {targetIdx[end - 1]} if {expr} else {end}')
+                    break
+                if node.rd != MIPSRegister.ZERO:
+                    lines.append(f'    r[{int(node.rd)}] = {expr}')
+            if end >= len(src) or end in leaders:
+                lines.append(f'    return {end}')
+                break
+        namespace: Dict[str, Callable[[List[int]], int]] = {}
+        exec('\n'.join(lines), namespace)
+        table[start] = (namespace['block'], end - start)
+    return table
+
+
+# Pipeline slot indices (slot N holds the output of the stage before it)
+SLOT_ID = 0   # IF -> ID
+SLOT_EX = 1   # ID -> EX
+SLOT_MEM = 2  # EX -> MEM
+SLOT_WB = 3   # MEM -> WB
+NUM_SLOTS = 4
+
+# Occupancy bits for each slot, see CPU._pipeMask
+_BIT_ID = 1 << SLOT_ID
+_BIT_EX = 1 << SLOT_EX
+_BIT_MEM = 1 << SLOT_MEM
+_BIT_WB = 1 << SLOT_WB
 
 
-class IDContext(PipelineContext):
+class PipelineContext(object):
     """
-    Used for data passed from ID -> EX.
+    Used for data stored in each stage of the pipeline.
+
+    A single layout is shared by every stage, so a context can be advanced
+    through the pipeline (and reused afterwards) by updating it in place.
+    Fields that a stage hasn't computed yet hold their defaults.
 
     Fields
     ------
+    exId: ExId
+        Execution unit id
+    pc: int
+        Index of the instruction being executed
     rdTarget: MIPSRegister
-        Register to write to
+        Register to write to (set by ID, may be overridden by EX)
+    rdValue: int
+        Computed output value (set by EX)
     stalled: bool
-        Track if NOP's have already been generated for this stage
+        Track if NOP's have already been generated for the EX stage
     
     """
 
-    rdTarget: MIPSRegister
-    stalled: bool = False
-
-    def __init__(self, source: IFContext, rdTarget: MIPSRegister):
-        super().__init__(source.exId, source.node)
-        self.rdTarget = rdTarget
+    __slots__ = ('exId', 'pc', 'rdTarget', 'rdValue', 'stalled')
 
-
-class EXContext(PipelineContext):
-    """
-    Context passed from EX -> MEM -> WB.
-
-    Fields
-    ------
-    rdValue: int
-        Computed output value
+    exId: ExId
+    pc: int
     rdTarget: MIPSRegister
-        Register to write to
-    """
-
     rdValue: int
-    rdTarget: MIPSRegister
+    stalled: bool
 
-    def __init__(self, source: IDContext, rdValue: int, rdTarget: Optional[MIPSRegister] = None):
-        """
-        Create EXContext.
+    def __init__(self):
+        self.reset(None, 0)
 
-        Parameters
-        ----------
-        source: IDContext
-            Previous stage's context
-        rdValue: int
-            Computed rD value
-        rdTarget: MIPSRegister?
-            Override write target
-        
-        """
-        super().__init__(source.exId, source.node)
-        self.rdValue = rdValue
-        self.rdTarget = rdTarget or source.rdTarget
+    def reset(self, exId: ExId, pc: int):
+        """Prepare context to carry a new execution unit."""
+        self.exId = exId
+        self.pc = pc
+        self.rdTarget = MIPSRegister.ZERO
+        self.rdValue = 0
+        self.stalled = False
 
 
-MEMContext = EXContext
+# Register availability with no outstanding locks
+_NO_LOCKS: Tuple[int, ...] = (0,) * NUM_REGISTERS
+# Forwarding ready cycle for registers with no result in flight
+_NEVER = sys.maxsize
 
 
 class CPU(object):
@@ -78,6 +196,7 @@ class CPU(object):
     MIPS CPU emulator.
 
     Events are generated each cycle which can help diagram the state of the CPU.
+    They are plain EventRecord tuples; use logger.toEvent to get a LogEvent.
 
     Fields
     ------
@@ -85,37 +204,82 @@ class CPU(object):
         Whether or not to enable register forwarding
     currentCycle: int
         Current cycle number (starting at 0)
-    registers: Dict[MIPSRegister, int]
-        Register name->value lookup
-    registerAvailability: Dict[MIPSRegister, int]
-        LUT of when registers will become available again
+    _pc: int
+        Program counter
+    registers: List[int]
+        Register values, indexed by MIPSRegister (PC is held separately, see `pc`)
+    registerAvailability: List[int]
+        LUT of when registers will become available again, indexed by MIPSRegister
+    forwardValue: List[int]
+        Newest result computed by EX but not yet written back, indexed by MIPSRegister
+    forwardReady: List[int]
+        First cycle forwardValue can be forwarded, indexed by MIPSRegister
+        (_NEVER if no result is in flight)
     instructions: List[Node]
         Source instruction list
+    _ninst: int
+        Number of source instructions
+    _labels: Dict[str, int]
+        Label name->instruction index lookup
+    instCode: List[MIPSInstruction]
+        Decoded instruction, indexed by instruction index
+    flags: List[int]
+        Instruction category flags (FLAG_*), indexed by instruction index
+    inputMode: List[int]
+        EX operand mode (INPUT_*), indexed by instruction index
+    exOp: List[Callable[[int, int], int]]
+        EX operation (from _EX_TABLE), indexed by instruction index
+    rsIdx: List[Optional[MIPSRegister]]
+        Decoded rS register, indexed by instruction index
+    rtIdx: List[Optional[MIPSRegister]]
+        Decoded rT register, indexed by instruction index
+    rdIdx: List[Optional[MIPSRegister]]
+        Decoded rD register, indexed by instruction index
+    imm: List[Optional[int]]
+        Decoded immediate value, indexed by instruction index
+    targetIdx: List[Optional[int]]
+        Resolved branch target (None for non-branches), indexed by instruction index
     nextExId: ExId
         Tracks next ExId to issue
-    pipeline_id: Optional[IFContext]
-        IF -> ID pipeline storage
-    pipeline_ex: Optional[IDContext]
-        ID -> EX pipeline storage
-    pipeline_mem: Optional[EXContext]
-        EX -> MEM pipeline storage
-    pipeline_wb: Optional[MEMContext]
-        MEM -> WB pipeline storage
+    pipeline: List[Optional[PipelineContext]]
+        Pipeline storage, indexed by SLOT_*
+    _pipeMask: int
+        Summary of which pipeline slots are occupied (bit N set if slot N is)
+    _contextPool: List[PipelineContext]
+        Contexts that have left the pipeline, available for reuse
+    _blockTable: Optional[List[Optional[Tuple[Callable[[List[int]], int], int]]]]
+        Compiled basic blocks for runFast (None until first used)
     
     """
     
     forwarding: bool
     currentCycle: int
-    registers: Dict[MIPSRegister, int]
-    registerAvailability: Dict[MIPSRegister, int]
+    _pc: int
+    registers: List[int]
+    registerAvailability: List[int]
+    forwardValue: List[int]
+    forwardReady: List[int]
     instructions: List[Node]
+    _ninst: int
+    _labels: Dict[str, int]
     nextExId: ExId
 
+    # Decoded program
+    instCode: List[MIPSInstruction]
+    flags: List[int]
+    inputMode: List[int]
+    exOp: List[Callable[[int, int], int]]
+    rsIdx: List[Optional[MIPSRegister]]
+    rtIdx: List[Optional[MIPSRegister]]
+    rdIdx: List[Optional[MIPSRegister]]
+    imm: List[Optional[int]]
+    targetIdx: List[Optional[int]]
+
     # Pipeline
-    pipeline_id: Optional[IFContext]
-    pipeline_ex: Optional[IDContext]
-    pipeline_mem: Optional[EXContext]
-    pipeline_wb: Optional[MEMContext]
+    pipeline: List[Optional[PipelineContext]]
+    _pipeMask: int
+    _contextPool: List[PipelineContext]
+    _blockTable: Optional[List[Optional[Tuple[Callable[[List[int]], int], int]]]]
 
     def __init__(self, src: List[Node], forwarding: bool):
         """
@@ -130,83 +294,89 @@ class CPU(object):
         
         """
         self.instructions = src
+        self._ninst = len(src)
+        self._labels = {}
+        for i, node in enumerate(src):
+            if node.label is not None:
+                # First definition wins
+                self._labels.setdefault(node.label, i)
+        self._decodeProgram(src)
         self.forwarding = forwarding
-        self.registers = {}
-        self.registerAvailability = {}
+        self._pc = 0
+        self.registers = [0] * NUM_REGISTERS
+        self.registerAvailability = [0] * NUM_REGISTERS
+        self.forwardValue = [0] * NUM_REGISTERS
+        self.forwardReady = [_NEVER] * NUM_REGISTERS
         self.nextExId = 0
         self.currentCycle = 0
-        self.pipeline_id = None
-        self.pipeline_ex = None
-        self.pipeline_mem = None
-        self.pipeline_wb = None
+        self.pipeline = [None] * NUM_SLOTS
+        self._pipeMask = 0
+        # At most one context per slot is ever live
+        self._contextPool = [PipelineContext() for _ in range(NUM_SLOTS)]
+        self._blockTable = None
+    
+    def _decodeProgram(self, src: List[Node]):
+        """
+        Decode source nodes into per-field instruction arrays.
+
+        Pipeline stages read instruction fields by index from these arrays. Branch
+        targets are resolved here, so a taken branch only needs a single load.
+        """
+        self.instCode = [node.inst for node in src]
+        self.flags = [_INST_FLAGS[node.inst] for node in src]
+        self.inputMode = [_INPUT_MODE[node.inst] for node in src]
+        self.exOp = [_EX_TABLE[node.inst] for node in src]
+        self.rsIdx = [node.rs for node in src]
+        self.rtIdx = [node.rt for node in src]
+        self.rdIdx = [node.rd for node in src]
+        self.imm = [node.immediate for node in src]
+        self.targetIdx = [self._resolveTarget(node) for node in src]
+
+    def _resolveTarget(self, node: Node) -> Optional[int]:
+        """
+        Resolve the jump target of a node.
+
+        Parameters
+        ----------
+        node: Node
+            Source node
+        
+        Returns
+        -------
+        Optional[int]
+            Index of labelled instruction, or None if node isn't a branch
+        
+        Raises
+        ------
+        RuntimeError
+            If node is a branch to a label that isn't defined
+        """
+        if not node.inst.isBranch:
+            return None
+        try:
+            return self._labels[node.target]
+        except KeyError:
+            raise RuntimeError(f'Unable to resolve label target: {node.target}') from None
     
     @property
     def pc(self) -> int:
         """Get program counter."""
-        return self.registers.setdefault(MIPSRegister.PC, 0)
+        return self._pc
     
     @pc.setter
     def pc(self, value: int):
-        self.registers[MIPSRegister.PC] = value
+        self._pc = value
     
     @property
     def running(self) -> bool:
         """Get if the CPU is still running."""
-        return self.pc < len(self.instructions) \
-            or (self.pipeline_id is not None) \
-            or (self.pipeline_ex is not None) \
-            or (self.pipeline_mem is not None) \
-            or (self.pipeline_wb is not None)
+        return self._pc < self._ninst or self._pipeMask != 0
     
     def register(self, reg: MIPSRegister) -> int:
         """Lookup a register's value."""
-        return self.registers.setdefault(reg, 0)
-    
-    def _applyIF(self) -> Iterable[LogEvent]:
-        """Run the IF stage."""
-        if self.pipeline_id is not None:
-            # IF blocked
-            return
-        
-        pc = self.pc
-        if pc >= len(self.instructions):
-            # End of program
-            return
-        
-        node = self.instructions[pc]
-        exId = self.nextExId
-        self.nextExId += 1
-        self.pc = pc + 1
-
-        # Complete IF
-        self.pipeline_id = IFContext(exId, node)
-        yield InstructionFetchEvent(exId, self.currentCycle, node)
-    
-    def _applyID(self) -> Iterable[LogEvent]:
-        """Apply the ID stage, and get all generated events."""
-        context = self.pipeline_id
-        if context is None:
-            # ID empty
-            return
-        if self.pipeline_ex is not None:
-            # ID blocked (EX filled)
-            yield PipelineStallEvent(context.exId, self.currentCycle, 'IF', 0)
-            return
-        
-        node = context.node
-        inst = node.inst
-        
-        rdTarget = MIPSRegister.ZERO
-        if inst.isArithmetic or inst.isImmediate:
-            # Acquire rd
-            rdTarget = node.rd
-        elif inst.isBranch:
-            rdTarget = MIPSRegister.PC
-        
-        # Complete ID
-        yield StageAdvanceEvent(context.exId, self.currentCycle, "ID")
-        self.pipeline_id = None
-        self.pipeline_ex = IDContext(context, rdTarget=rdTarget)
+        if reg == MIPSRegister.PC:
+            return self._pc
+        return self.registers[reg]
     
     def _getExRegister(self, reg: MIPSRegister) -> Tuple[int, int]:
         """
@@ -227,18 +397,15 @@ class CPU(object):
             Register value
         
         """
-        available = self.registerAvailability.get(reg, 0)
-        value = self.registers.get(reg, 0)
-        if available <= self.currentCycle:
-            return (available, value)
-        if self.forwarding:
-            if (self.pipeline_mem is not None) and (self.pipeline_mem.rdTarget == reg):
-                return (self.currentCycle, self.pipeline_mem.rdValue)
-            if (self.pipeline_wb is not None) and (self.pipeline_wb.rdTarget == reg):
-                return (self.currentCycle, self.pipeline_wb.rdValue)
-        return (available, value)
+        available = self.registerAvailability[reg]
+        cycle = self.currentCycle
+        if available <= cycle:
+            return (available, self.registers[reg])
+        if self.forwarding and self.forwardReady[reg] <= cycle:
+            return (cycle, self.forwardValue[reg])
+        return (available, self.registers[reg])
     
-    def _getExInputs(self, node: Node) -> Tuple[int, int, int]:
+    def _getExInputs(self, pc: int) -> Tuple[int, int, int]:
         """
         Get EX inputs & availability.
 
@@ -246,8 +413,8 @@ class CPU(object):
 
         Parameters
         ----------
-        node: Node
-            Source node
+        pc: int
+            Instruction index
         
         Returns
         -------
@@ -259,16 +426,16 @@ class CPU(object):
             rT value
         
         """
-        inst = node.inst
-        if inst == MIPSInstruction.NOP:
+        mode = self.inputMode[pc]
+        if mode == INPUT_NONE:
             return (0, None, None)
         
-        rsAvail, rsValue = self._getExRegister(node.rs)
-        if inst.isImmediate:
-            return (rsAvail, rsValue, node.immediate)
+        rsAvail, rsValue = self._getExRegister(self.rsIdx[pc])
+        if mode == INPUT_IMM:
+            return (rsAvail, rsValue, self.imm[pc])
         
-        rtAvail, rtValue = self._getExRegister(node.rt)
-        return (max(rsAvail, rtAvail), rsValue, rtValue)
+        rtAvail, rtValue = self._getExRegister(self.rtIdx[pc])
+        return (rsAvail if rsAvail > rtAvail else rtAvail, rsValue, rtValue)
     
     def _acquireRegisterLock(self, reg: MIPSRegister, duration: int):
         """
@@ -285,162 +452,366 @@ class CPU(object):
         if reg in (MIPSRegister.ZERO, MIPSRegister.PC):
             # You can't acquire these
             return
-        releaseCycle = max(self.registerAvailability.get(reg, 0), self.currentCycle + duration)
+        releaseCycle = max(self.registerAvailability[reg], self.currentCycle + duration)
         self.registerAvailability[reg] = releaseCycle
     
-    def _computeEx(self, inst: MIPSInstruction, rS: int, rT: int) -> int:
+    def cycle(self) -> List[EventRecord]:
         """
-        Actually compute the result of EX.
+        Run a single cycle, and get all generated events.
 
-        Parameters
-        inst: MIPSInstruction
-            Instruction
-        rS: int
-            First parameter
-        rT: int
-            Second parameter
+        Stages are run back to front (WB, MEM, EX, ID, IF) in a single body, with the
+        pipeline slots held in locals until the end of the cycle. Each stage sees the
+        slot ahead of it after that stage has already run this cycle.
+        """
+        events: List[EventRecord] = []
+        cycle = self.currentCycle
+        pipeline = self.pipeline
+        idSlot, exSlot, memSlot, wbSlot = pipeline
+        mask = self._pipeMask
+        forwardReady = self.forwardReady
+        pool = self._contextPool
+
+        # WB
+        context = wbSlot
+        if context is not None:
+            rd = context.rdTarget
+            if (memSlot is None) or (memSlot.rdTarget != rd):
+                # Nothing left in flight to forward for rd
+                forwardReady[rd] = _NEVER
+            if (rd == MIPSRegister.PC) and (context.rdValue != context.pc + 1):
+                # Flush pipeline if we're leaving program order (oldest first)
+                if memSlot is not None:
+                    forwardReady[memSlot.rdTarget] = _NEVER
+                for flushed in (memSlot, exSlot, idSlot):
+                    if flushed is not None:
+                        events.append((EV_ADVANCE, flushed.exId, cycle, STAGE_FLUSH, 0))
+                        pool.append(flushed)
+                memSlot = exSlot = idSlot = None
+                mask &= ~(_BIT_ID | _BIT_EX | _BIT_MEM)
+                # Flush register locks (in place, the list is never reallocated)
+                self.registerAvailability[:] = _NO_LOCKS
+                self._pc = context.rdValue
+            elif rd != MIPSRegister.ZERO and rd != MIPSRegister.PC:
+                # Don't actually write to $zero (or to PC for a branch to the next instruction)
+                self.registers[rd] = context.rdValue
+
+            # Complete WB
+            wbSlot = None
+            mask &= ~_BIT_WB
+            events.append((EV_ADVANCE, context.exId, cycle, STAGE_WB, 0))
+            events.append((EV_EXIT, context.exId, cycle, None, 0))
+            pool.append(context)
         
-        Returns
-        -------
-        int
-            Computed result
+        # MEM (never blocked, as WB always empties its slot)
+        context = memSlot
+        if context is not None:
+            # Complete MEM
+            memSlot = None
+            wbSlot = context  # No changes here
+            mask ^= _BIT_MEM | _BIT_WB
+            events.append((EV_ADVANCE, context.exId, cycle, STAGE_MEM, 0))
         
-        """
-        if inst in (MIPSInstruction.ADD, MIPSInstruction.ADDI):
-            return rS + rT
-        elif inst in (MIPSInstruction.AND, MIPSInstruction.ANDI):
-            return rS & rT
-        elif inst in (MIPSInstruction.OR, MIPSInstruction.ORI):
-            return rS | rT
-        elif inst in (MIPSInstruction.SLT, MIPSInstruction.SLTI):
-            return 1 if (rS < rT) else 0
-        elif inst == MIPSInstruction.BEQ:
-            return 1 if (rS == rT) else 0
-        elif inst == MIPSInstruction.BNE:
-            return 1 if (rS != rT) else 0
-        else:
-            raise ValueError("Unknown instruction")
+        # EX (only blocked by its operands, as MEM always empties its slot)
+        context = exSlot
+        if context is not None:
+            pc = context.pc
+            flags = self.flags[pc]
+            if flags == 0:
+                # nop: nothing to wait on, lock, compute or publish
+                exSlot = None
+                memSlot = context
+                mask ^= _BIT_EX | _BIT_MEM
+                events.append((EV_ADVANCE, context.exId, cycle, STAGE_EX, 0))
+            else:
+                available, rsValue, rtValue = self._getExInputs(pc)
+                now = cycle if self.forwarding else (cycle - 1)
+                if available > now:
+                    # ID block
+                    stalls = 0 if context.stalled else (available - now)
+                    context.stalled = True
+                    events.append((EV_STALL, context.exId, cycle, STAGE_ID, stalls))
+                else:
+                    if flags & FLAG_WRITES_RD:
+                        # Acquire rd
+                        self._acquireRegisterLock(self.rdIdx[pc], 2)
+                    
+                    result = self.exOp[pc](rsValue, rtValue)
+                    rdTarget = context.rdTarget
+
+                    if flags & FLAG_BRANCH:
+                        if result != 0:
+                            result = self.targetIdx[pc]
+                            rdTarget = MIPSRegister.PC
+                        else:
+                            # Effectively a NOP from here on out
+                            result = 0
+                            rdTarget = MIPSRegister.ZERO
+                    
+                    # Complete EX
+                    context.rdValue = result
+                    context.rdTarget = rdTarget
+                    # Publish result for forwarding while it's in MEM/WB
+                    self.forwardValue[rdTarget] = result
+                    forwardReady[rdTarget] = cycle
+                    exSlot = None
+                    memSlot = context
+                    mask ^= _BIT_EX | _BIT_MEM
+                    events.append((EV_ADVANCE, context.exId, cycle, STAGE_EX, 0))
+        
+        # ID
+        context = idSlot
+        if context is not None:
+            if exSlot is not None:
+                # ID blocked (EX filled)
+                events.append((EV_STALL, context.exId, cycle, STAGE_IF, 0))
+            else:
+                pc = context.pc
+                flags = self.flags[pc]
+                
+                rdTarget = MIPSRegister.ZERO
+                if flags & FLAG_WRITES_RD:
+                    # Acquire rd
+                    rdTarget = self.rdIdx[pc]
+                elif flags & FLAG_BRANCH:
+                    rdTarget = MIPSRegister.PC
+                
+                # Complete ID
+                context.rdTarget = rdTarget
+                idSlot = None
+                exSlot = context
+                mask ^= _BIT_ID | _BIT_EX
+                events.append((EV_ADVANCE, context.exId, cycle, STAGE_ID, 0))
+        
+        # IF (blocked if ID is still filled)
+        pc = self._pc
+        if idSlot is None and pc < self._ninst:
+            exId = self.nextExId
+            self.nextExId = exId + 1
+            self._pc = pc + 1
+
+            # Complete IF
+            context = pool.pop()
+            context.reset(exId, pc)
+            idSlot = context
+            mask |= _BIT_ID
+            events.append((EV_FETCH, exId, cycle, self.instructions[pc], 0))
+        
+        pipeline[SLOT_ID] = idSlot
+        pipeline[SLOT_EX] = exSlot
+        pipeline[SLOT_MEM] = memSlot
+        pipeline[SLOT_WB] = wbSlot
+        self._pipeMask = mask
+
+        events.append((EV_EOC, None, cycle, None, 0))
+
+        self.currentCycle = cycle + 1
+        return events
     
-    def _computeJumpTarget(self, target: str) -> int:
+    def runFast(self, maxSteps: Optional[int] = None) -> int:
         """
-        Compute jump address with O(n) lookup.
+        Run the rest of the program without simulating the pipeline.
+
+        The program is executed one instruction at a time in program order (a
+        branch that isn't taken falls through, as in cycle()), with each basic
+        block compiled to a single Python function. No events are generated and
+        no cycles are counted, so this is only useful when just the final register
+        state is needed.
 
         Parameters
-        ---------
-        target: str
-            Target label
+        ----------
+        maxSteps: int?
+            Stop after about this many instructions (checked between blocks), as
+            programs may loop forever
         
         Returns
         -------
         int
-            Address of labelled instruction
+            Number of instructions executed
         
+        Raises
+        ------
+        RuntimeError
+            If the pipeline is not empty
         """
-        try:
-            return next(i for i, node in enumerate(self.instructions) if node.label == target)
-        except StopIteration:
-            raise RuntimeError(f'Unable to resolve label target: {target}')
-        
-    def _applyEX(self) -> Iterable[LogEvent]:
-        """Apply EX stage, and get events."""
-        context = self.pipeline_ex
-        if context is None:
-            # EX empty
-            return
+        if self._pipeMask != 0:
+            raise RuntimeError('Unable to run fast with instructions in the pipeline')
+        pc = self._pc
+        end = self._ninst
+        table = self._blockTable
+        if table is None or (pc < end and table[pc] is None):
+            # Blocks are only compiled for the entry point they were first run from
+            self._blockTable = table = _compileBlocks(self.instructions, self.targetIdx, pc)
         
-        node = context.node
-        inst = node.inst
-        available, rsValue, rtValue = self._getExInputs(context.node)
-        now = self.currentCycle if self.forwarding else (self.currentCycle - 1)
-        if available > now:
-            # ID block
-            if not context.stalled:
-                yield PipelineStallEvent(context.exId, self.currentCycle, 'ID', available - now)
-            else:
-                yield PipelineStallEvent(context.exId, self.currentCycle, 'ID', 0)
-            context.stalled = True
-            return
+        registers = self.registers
+        steps = 0
+        while pc < end and (maxSteps is None or steps < maxSteps):
+            function, count = table[pc]
+            pc = function(registers)
+            steps += count
+        self._pc = pc
+        return steps
 
-        if self.pipeline_mem is not None:
-            # EX blocked
-            yield PipelineStallEvent(context.exId, self.currentCycle, 'ID', 0)
-            return
-        
-        if inst.isArithmetic or inst.isImmediate:
-            # Acquire rd
-            self._acquireRegisterLock(node.rd, 2)
-        
-        result = self._computeEx(inst, rsValue, rtValue)
-        rdTarget = context.rdTarget
 
-        if inst.isBranch:
-            if result != 0:
-                result = self._computeJumpTarget(context.node.target)
-                rdTarget = MIPSRegister.PC
-            else:
-                # Effectively a NOP from here on out
-                result = 0
-                rdTarget = MIPSRegister.ZERO
-        
-        # Complete EX
-        yield StageAdvanceEvent(context.exId, self.currentCycle, "EX")
-        self.pipeline_ex = None
-        self.pipeline_mem = EXContext(context, result, rdTarget=rdTarget)
-    
-    def _applyMEM(self) -> Iterable[LogEvent]:
-        """Apply MEM stage, and get events."""
-        context = self.pipeline_mem
-        if context is None:
-            # MEM empty
-            return
-        if self.pipeline_wb is not None:
-            # MEM blocked
-            yield PipelineStallEvent(context.exId, self.currentCycle, 'EX', 0)
-            return
+def runAll(cpu: CPU, maxCycles: Optional[int] = None) -> List[EventRecord]:
+    """
+    Run CPU until it halts, and get all generated events.
 
-        # Complete MEM
-        yield StageAdvanceEvent(context.exId, self.currentCycle, "MEM")
-        self.pipeline_mem = None
-        self.pipeline_wb = context  # No changes here
+    Events are accumulated into a single list from a flat loop, which keeps
+    the driver friendly to tracing JITs (e.g., PyPy).
+
+    Parameters
+    ----------
+    cpu: CPU
+        CPU to run
+    maxCycles: int?
+        Stop after this many cycles, even if the CPU is still running
     
-    def _applyWB(self) -> Iterable[LogEvent]:
-        """Apply WB stage, and get events."""
-        context = self.pipeline_wb
-        if context is None:
-            # WB empty
-            return
-        
-        rd = context.rdTarget
-        if (rd == MIPSRegister.PC) and (context.rdValue != self.pc):
-            # Flush pipeline if we're altering the PC
-            if self.pipeline_mem is not None:
-                yield StageAdvanceEvent(self.pipeline_mem.exId, self.currentCycle, '*')
-                self.pipeline_mem = None
-            if self.pipeline_ex is not None:
-                yield StageAdvanceEvent(self.pipeline_ex.exId, self.currentCycle, '*')
-                self.pipeline_ex = None
-            if self.pipeline_id is not None:
-                yield StageAdvanceEvent(self.pipeline_id.exId, self.currentCycle, '*')
-                self.pipeline_id = None
-            # Flush register locks
-            self.registerAvailability = dict()
-        
-        if rd != MIPSRegister.ZERO:  # Don't actually write to $zero
-            self.registers[rd] = context.rdValue
+    Returns
+    -------
+    List[EventRecord]
+        Every event generated, in order
+    
+    """
+    events: List[EventRecord] = []
+    cycles = 0
+    while cpu.running and (maxCycles is None or cycles < maxCycles):
+        events.extend(cpu.cycle())
+        cycles += 1
+    return events
+
+
+def streamEvents(cpu: CPU) -> Iterator[EventRecord]:
+    """Run CPU until it halts, yielding events as they are generated."""
+    while cpu.running:
+        yield from cpu.cycle()
 
-        # Complete WB
-        self.pipeline_wb = None
-        yield StageAdvanceEvent(context.exId, self.currentCycle, "WB")
-        yield PipelineExitEvent(context.exId, self.currentCycle)
+
+# Column of each stage in a simulateTrace() row (the column is the stage tag)
+TRACE_STAGES = STAGE_NAMES[STAGE_IF:STAGE_WB + 1]
+
+
+def simulateTrace(cpu: CPU, maxCycles: Optional[int] = None) -> List[List[int]]:
+    """
+    Run CPU until it halts, and get the cycle each execution unit entered each stage.
+
+    This is meant for analysis that only needs timing (e.g., comparing a program
+    with and without forwarding), so no events are kept around.
+
+    Parameters
+    ----------
+    cpu: CPU
+        CPU to run
+    maxCycles: int?
+        Stop after this many cycles, even if the CPU is still running
+    
+    Returns
+    -------
+    List[List[int]]
+        Stage cycles indexed by ExId (relative to the first execution unit fetched
+        by this call), then by column of TRACE_STAGES. Stages that an execution unit
+        never reached (e.g., flushed or still in flight) are -1. If the CPU has
+        already been cycled, execution units fetched before this call aren't traced.
+    
+    """
+    trace: List[List[int]] = []
+    # ExId of the first execution unit fetched here
+    firstExId = cpu.nextExId
+    cycles = 0
+    while cpu.running and (maxCycles is None or cycles < maxCycles):
+        for kind, exId, cycle, arg, _ in cpu.cycle():
+            if kind == EV_FETCH:
+                trace.append([cycle, -1, -1, -1, -1])
+            elif kind == EV_ADVANCE and arg <= STAGE_WB and exId >= firstExId:
+                trace[exId - firstExId][arg] = cycle
+        cycles += 1
+    return trace
+
+
+def _traceJob(job: Tuple[List[Node], bool, Optional[int]]) -> List[List[int]]:
+    """Worker for simulateBatch."""
+    src, forwarding, maxCycles = job
+    return simulateTrace(CPU(src, forwarding=forwarding), maxCycles)
+
+
+def simulateBatch(jobs: Iterable[Tuple[List[Node], bool]], maxCycles: Optional[int] = None, workers: Optional[int] = None) -> List[List[List[int]]]:
+    """
+    Run simulateTrace over many programs in parallel.
+
+    Every simulation is independent, so each job runs on its own CPU in a
+    worker process (sidestepping the GIL).
+
+    Parameters
+    ----------
+    jobs: Iterable[Tuple[List[Node], bool]]
+        Pairs of (source nodes, forwarding) to simulate
+    maxCycles: int?
+        Cycle limit for each simulation
+    workers: int?
+        Number of worker processes (defaults to the number of CPUs)
     
-    def cycle(self) -> Iterable[LogEvent]:
-        # WB Stage
-        yield from self._applyWB()
-        yield from self._applyMEM()
-        yield from self._applyEX()
-        yield from self._applyID()
-        yield from self._applyIF()
+    Returns
+    -------
+    List[List[List[int]]]
+        Result of simulateTrace for each job, in order
+    
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_traceJob, ((src, forwarding, maxCycles) for src, forwarding in jobs)))
+
+
+def scheduleTrace(src: List[Node], forwarding: bool) -> List[List[int]]:
+    """
+    Compute the stage cycles of a branch-free program without simulating it.
+
+    Without branches, every instruction is executed exactly once in program
+    order, so each stage's cycle is just the latest of the constraints on it:
 
-        yield EndOfCycleEvent(self.currentCycle)
+        IF[i]  = max(IF[i-1] + 1, ID[i-1])   (ID slot free)
+        ID[i]  = max(IF[i] + 1, EX[i-1])     (EX slot free)
+        EX[i]  = max(ID[i] + 1, ready(rs), ready(rt))
+        MEM[i] = EX[i] + 1
+        WB[i]  = EX[i] + 2
 
-        self.currentCycle += 1
+    where, without forwarding, a register is ready 3 cycles after its last
+    writer's EX. With forwarding, EX[i] only waits on ID[i] (the ready terms
+    are dropped).
+
+    Parameters
+    ----------
+    src: List[Node]
+        Source instruction list (may not contain branches)
+    forwarding: bool
+        If forwarding is enabled
+    
+    Returns
+    -------
+    List[List[int]]
+        Same as simulateTrace for a CPU running src to completion
+    
+    Raises
+    ------
+    ValueError
+        If src contains a branch
+    
+    """
+    ready = [0] * NUM_REGISTERS
+    trace: List[List[int]] = []
+    fetch = decode = execute = -1
+    for node in src:
+        inst = node.inst
+        flags = _INST_FLAGS[inst]
+        if flags & FLAG_BRANCH:
+            raise ValueError(f'Unable to schedule branch: {node}')
+        fetch = max(fetch + 1, decode)
+        decode = max(fetch + 1, execute)
+        execute = decode + 1
+        if not forwarding:
+            mode = _INPUT_MODE[inst]
+            if mode != INPUT_NONE:
+                execute = max(execute, ready[node.rs])
+            if mode == INPUT_REG_REG:
+                execute = max(execute, ready[node.rt])
+            if flags & FLAG_WRITES_RD and node.rd != MIPSRegister.ZERO:
+                ready[node.rd] = execute + 3
+        trace.append([fetch, decode, execute, execute + 1, execute + 2])
+    return trace
@@ -1,6 +1,6 @@
 """Contains IR structures."""
 
-from enum import Enum, IntEnum
+from enum import IntEnum
 from typing import Optional
 
 
@@ -39,13 +39,19 @@ class MIPSRegister(IntEnum):
     FP = 30
     RA = 31
 
-    PC = 64
+    PC = 32
 
     def __str__(self) -> str:
         #return mapped string
-        return '$' + self.name.lower()
+        return _REGISTER_STR[self]
 
-class MIPSInstruction(Enum):
+
+# Size of a register file indexed by MIPSRegister
+NUM_REGISTERS = len(MIPSRegister)
+# String of each register, indexed by MIPSRegister
+_REGISTER_STR = tuple('$' + reg.name.lower() for reg in MIPSRegister)
+
+class MIPSInstruction(IntEnum):
     #enumerate instructions
     NOP  = 0
     ADD  = 1
@@ -62,21 +68,43 @@ class MIPSInstruction(Enum):
     @property
     def isArithmetic(self):
         """Predicate for if instruction matches form `INST rd,rs,rt`"""
-        return self in (MIPSInstruction.ADD, MIPSInstruction.AND, MIPSInstruction.OR, MIPSInstruction.SLT)
+        return bool(_CATEGORY[self] & _CAT_ARITHMETIC)
     
     @property
     def isImmediate(self):
         """Predicate for if instruction matches form `INST rd,rs,imm`"""
-        return self in (MIPSInstruction.ADDI, MIPSInstruction.ANDI, MIPSInstruction.ORI, MIPSInstruction.SLTI)
+        return bool(_CATEGORY[self] & _CAT_IMMEDIATE)
 
     @property
     def isBranch(self):
         """Predicate for if instruction matches form `INST rs,rt,target`"""
-        return self in (MIPSInstruction.BEQ, MIPSInstruction.BNE)
+        return bool(_CATEGORY[self] & _CAT_BRANCH)
 
     def __str__(self):
         #return mapped string
-        return self.name.lower()
+        return _INSTRUCTION_STR[self]
+
+
+# String of each instruction, indexed by MIPSInstruction
+_INSTRUCTION_STR = tuple(inst.name.lower() for inst in MIPSInstruction)
+# Instruction category bits
+_CAT_ARITHMETIC = 1 << 0
+_CAT_IMMEDIATE = 1 << 1
+_CAT_BRANCH = 1 << 2
+# Category bitmask of each instruction, indexed by MIPSInstruction
+_CATEGORY = (
+    0,                  # NOP
+    _CAT_ARITHMETIC,    # ADD
+    _CAT_ARITHMETIC,    # AND
+    _CAT_ARITHMETIC,    # OR
+    _CAT_ARITHMETIC,    # SLT
+    _CAT_BRANCH,        # BEQ
+    _CAT_BRANCH,        # BNE
+    _CAT_IMMEDIATE,     # ADDI
+    _CAT_IMMEDIATE,     # ANDI
+    _CAT_IMMEDIATE,     # ORI
+    _CAT_IMMEDIATE,     # SLTI
+)
 
 class Node(object):
     """
@@ -98,15 +126,18 @@ class Node(object):
         target (optional)
             Jump target label
     """
+
+    __slots__ = ('text', 'label', 'inst', 'rd', 'rs', 'rt', 'immediate', 'target')
+
     def __init__(
             self,
             *,
             text: Optional[str] = None,
             label: Optional[str] = None,
             inst: MIPSInstruction,
-            rd: Optional[MIPSInstruction] = None,
-            rs: MIPSInstruction,
-            rt: Optional[MIPSInstruction] = None,
+            rd: Optional[MIPSRegister] = None,
+            rs: Optional[MIPSRegister],
+            rt: Optional[MIPSRegister] = None,
             immediate: Optional[int] = None,
             target: Optional[str] = None
     ):
@@ -122,16 +153,11 @@ class Node(object):
     def _asText(self) -> str:
         #return instruction as a string (formatted for output)
         inst = self.inst
-        if inst == MIPSInstruction.NOP:
-            return 'nop'
-        elif inst.isArithmetic:
-            return f'{inst!s} {self.rd!s},{self.rs!s},{self.rt!s}'
-        elif inst.isImmediate:
-            return f'{inst!s} {self.rd!s},{self.rs!s},{self.immediate}'
-        elif inst.isBranch:
-            return f'{inst!s} {self.rs!s},{self.rt!s},{self.target}'
-        else:
-            raise ValueError(f'Unexpected instruction {inst}')
+        try:
+            fmt = _FORMAT[inst]
+        except (IndexError, TypeError):
+            raise ValueError(f'Unexpected instruction {inst}') from None
+        return fmt(self)
 
     def __str__(self):
         #formatted string representation
@@ -140,21 +166,47 @@ class Node(object):
         return self.text
 
     def __repr__(self):
-        #unformatted string representation
-        args = []
-        if self.text is not None:
-            args.append(f'text={self.text!r}')
-        if self.label is not None:
-            args.append(f'label={self.label!r}')
-        args.append(f'inst={self.inst.name}')
-        if self.rd is not None:
-            args.append(f'rd={self.rd.name}')
-        if self.rs is not None:
-            args.append(f'rs={self.rs.name}')
-        if self.rt is not None:
-            args.append(f'rt={self.rt.name}')
-        if self.immediate is not None:
-            args.append(f'immediate={self.immediate!r}')
-        if self.target is not None:
-            args.append(f'target={self.target!r}')
-        return f"Node({', '.join(args)})"
+        #unformatted string representation (enum fields by name, the rest by repr)
+        rd, rs, rt, immediate, target = self.rd, self.rs, self.rt, self.immediate, self.target
+        pairs = (
+            ('text', self.text if self.text is None else repr(self.text)),
+            ('label', self.label if self.label is None else repr(self.label)),
+            ('inst', self.inst.name),
+            ('rd', rd if rd is None else rd.name),
+            ('rs', rs if rs is None else rs.name),
+            ('rt', rt if rt is None else rt.name),
+            ('immediate', immediate if immediate is None else repr(immediate)),
+            ('target', target if target is None else repr(target)),
+        )
+        args = ', '.join(f'{name}={value}' for name, value in pairs if value is not None)
+        return f'Node({args})'
+
+
+def _formatNop(node: Node) -> str:
+    #format `nop`
+    return 'nop'
+
+
+def _formatArithmetic(node: Node) -> str:
+    #format `INST rd,rs,rt`
+    return f'{node.inst!s} {node.rd!s},{node.rs!s},{node.rt!s}'
+
+
+def _formatImmediate(node: Node) -> str:
+    #format `INST rd,rs,imm`
+    return f'{node.inst!s} {node.rd!s},{node.rs!s},{node.immediate}'
+
+
+def _formatBranch(node: Node) -> str:
+    #format `INST rs,rt,target`
+    return f'{node.inst!s} {node.rs!s},{node.rt!s},{node.target}'
+
+
+# Text formatter of each instruction, indexed by MIPSInstruction
+_FORMAT = tuple(
+    _formatNop if inst == MIPSInstruction.NOP
+    else _formatArithmetic if inst.isArithmetic
+    else _formatImmediate if inst.isImmediate
+    else _formatBranch
+    for inst in MIPSInstruction
+)
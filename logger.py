@@ -1,15 +1,55 @@
 """Helps with recording CPU events."""
-from typing import List, Set, Dict, NewType, Optional
+import sys
+from array import array
+from typing import Any, Callable, Iterable, List, Dict, NewType, Optional, Tuple
 from ir import Node, MIPSInstruction
 
 ExId = NewType('ExId', int)
 
+# Debug tracing of logged events. Each Logger reads this once, when it's created, so
+# changing it afterwards only affects loggers created later.
 PRINT_EVENTS = False
 
+# Event record kinds
+EV_FETCH = 0
+EV_STALL = 1
+EV_ADVANCE = 2
+EV_EXIT = 3
+EV_EOC = 4
+
+# Stage tags used in event records
+STAGE_IF = 0
+STAGE_ID = 1
+STAGE_EX = 2
+STAGE_MEM = 3
+STAGE_WB = 4
+STAGE_FLUSH = 5
+# Diagram name of each stage tag
+STAGE_NAMES = ('IF', 'ID', 'EX', 'MEM', 'WB', '*')
+# Diagram cell of each stage tag
+_STAGE_CELLS = tuple(f'{name:<4}' for name in STAGE_NAMES)
+# LogEntry slot value for a cycle with no stage marked
+_UNMARKED = -1
+# Single unmarked LogEntry slot, repeated to size new rows
+_UNMARKED_ROW = array('b', [_UNMARKED])
+# Cycles preallocated per LogEntry (five stages, plus room for stalls)
+_ROW_WINDOW = 8
+
+# Event record emitted by the CPU: (kind, exId, cycle, arg, extra)
+#   EV_FETCH:   arg is the fetched Node
+#   EV_STALL:   arg is the stage tag, extra is the number of stalls
+#   EV_ADVANCE: arg is the stage tag
+EventRecord = Tuple[int, Optional[ExId], int, Any, int]
+
+# Node shown for every inserted nop row
+NOP_NODE = Node(text='nop', inst=MIPSInstruction.NOP, rs=None)
+
 
 class LogEvent(object):
     """Base log event type."""
 
+    __slots__ = ('exId', 'cycle')
+
     def __init__(self, exId: ExId, cycle: int):
         self.exId = exId
         self.cycle = cycle
@@ -18,6 +58,8 @@ class LogEvent(object):
 class InstructionFetchEvent(LogEvent):
     """Event generated when instruction enters IF"""
 
+    __slots__ = ('node',)
+
     def __init__(self, exId: ExId, cycle: int, node: Node):
         super().__init__(exId, cycle)
         self.node = node
@@ -29,6 +71,8 @@ class InstructionFetchEvent(LogEvent):
 class StageAdvanceEvent(LogEvent):
     """Event generated when instruction enters a ID/EX/MEM/WB."""
 
+    __slots__ = ('stage',)
+
     def __init__(self, exId: ExId, cycle: int, stage: str):
         super().__init__(exId, cycle)
         self.stage = stage
@@ -44,6 +88,8 @@ class PipelineStallEvent(LogEvent):
     This event may cause nop instructions to be generated.
     """
 
+    __slots__ = ('stage', 'stalls')
+
     def __init__(self, exId: ExId, cycle: int, stage: str, stalls: int):
         super().__init__(exId, cycle)
         self.stage = stage
@@ -56,6 +102,8 @@ class PipelineStallEvent(LogEvent):
 class PipelineExitEvent(LogEvent):
     """For when an execution unit leaves the pipeline."""
 
+    __slots__ = ()
+
     def __init__(self, exId: ExId, cycle: int):
         super().__init__(exId, cycle)
 
@@ -63,10 +111,41 @@ class PipelineExitEvent(LogEvent):
 class EndOfCycleEvent(LogEvent):
     """For when the cycle has been finished."""
 
+    __slots__ = ()
+
     def __init__(self, cycle: int):
         super().__init__(None, cycle)
 
 
+def toEvent(record: EventRecord) -> LogEvent:
+    """
+    Wrap an event record emitted by the CPU in its LogEvent class.
+
+    Parameters
+    ----------
+    record: EventRecord
+        Record to convert
+    
+    Returns
+    -------
+    LogEvent
+        Equivalent event object
+    
+    """
+    kind, exId, cycle, arg, extra = record
+    if kind == EV_FETCH:
+        return InstructionFetchEvent(exId, cycle, arg)
+    elif kind == EV_STALL:
+        return PipelineStallEvent(exId, cycle, STAGE_NAMES[arg], extra)
+    elif kind == EV_ADVANCE:
+        return StageAdvanceEvent(exId, cycle, STAGE_NAMES[arg])
+    elif kind == EV_EXIT:
+        return PipelineExitEvent(exId, cycle)
+    elif kind == EV_EOC:
+        return EndOfCycleEvent(cycle)
+    raise ValueError("Unknown event type")
+
+
 class LogEntry(object):
     """
     An entry representing a single execution unit.
@@ -86,17 +165,23 @@ class LogEntry(object):
         Cycle that the node started executing in
     width: int
         Generated table width (cycle-cells)
-    slots: List[str]
-        Current recorded events
+    slots: array
+        Stage tag recorded for each cycle since startCycle (_UNMARKED if none)
+    missed: bool
+        If the entry hasn't been marked yet this cycle (maintained by Logger)
     _strcache: Optional[str]
-        Cache for __str__
+        Cache for __str__ (None until rendered, and again after each mark)
 
     """
+
+    __slots__ = ('exId', 'node', 'startCycle', 'width', 'slots', 'missed', '_strcache')
+
     exId: ExId
     node: Node
     startCycle: int
     width: int
-    slots: List[str]
+    slots: array
+    missed: bool
     _strcache: Optional[str]
 
     def __init__(self, exId: ExId, node: Node, startCycle: int, width: int):
@@ -105,28 +190,39 @@ class LogEntry(object):
         self.node = node
         self.startCycle = startCycle
         self.width = width
-        self.slots = []
+        # Preallocated for a typical lifetime (capped by the table width), so
+        # marking is usually a single store
+        self.slots = _UNMARKED_ROW * max(min(width - startCycle, _ROW_WINDOW), 1)
+        self.missed = False
+        self._strcache = None
     
-    def markCycle(self, cycle: int, name: str):
-        """Mark entry with a label."""
+    def markCycle(self, cycle: int, stage: int):
+        """Mark entry with a stage tag."""
         offset = cycle - self.startCycle
-        if len(self.slots) <= offset:
-            self.slots += [None] * (1 + len(self.slots) - offset)
-        self.slots[offset] = name
+        self._strcache = None
+        try:
+            self.slots[offset] = stage
+        except IndexError:
+            # Outlived the preallocated window; skipped cycles stay unmarked
+            self.slots.extend(_UNMARKED_ROW * (offset + 1 - len(self.slots)))
+            self.slots[offset] = stage
     
     def bake(self):
         """Cache __str__ result."""
-        self._strcache = str(self)
+        str(self)
 
     def __str__(self) -> str:
         """Stringify entry, producing a table row."""
-        if hasattr(self, '_strcache'):
+        if self._strcache is not None:
             return self._strcache
-        result = f'{self.node!s:<20}'
-        result += '.   ' * self.startCycle
-        result += ''.join(f"{slot or '.':<4}" for slot in self.slots)
-        result += '.   ' * (self.width - len(self.slots) - self.startCycle)
-        return result.rstrip()
+        start = self.startCycle
+        # One 4-character cell per cycle, growing past width if the entry does
+        cells = ['.   '] * max(self.width, start + len(self.slots))
+        for i, slot in enumerate(self.slots, start):
+            if slot != _UNMARKED:
+                cells[i] = _STAGE_CELLS[slot]
+        self._strcache = (f'{self.node!s:<20}' + ''.join(cells)).rstrip()
+        return self._strcache
 
 
 class Logger(object):
@@ -138,99 +234,185 @@ class Logger(object):
     cycles: int
         Number of cycles wide to print
     history: List[LogEntry]
-        History of execution units
+        History of execution units (without nop's; see rows)
     current: Dict[ExId, LogEntry]
         Fast lookup for currently-being-modified entries
-    cycleMissed: Set[LogEntry]
-        Set of entries not modified the current cycle
+    nopsBefore: Dict[ExId, List[Tuple[LogEntry, int]]]
+        Nop entries (and how many rows of each) to show before an execution unit
     fakeExId: ExId
         Counter for nop inserts
+    _header: str
+        Diagram header row
+    _dispatch: Tuple[Callable[[ExId, int, Any, int], None], ...]
+        Record handlers, indexed by EV_* kind
+    _traced: bool
+        Whether records are printed as they're applied (PRINT_EVENTS)
     
     """
 
     cycles: int
     history: List[LogEntry]
     current: Dict[ExId, LogEntry]
-    cycleMissed: Set[LogEntry]
+    nopsBefore: Dict[ExId, List[Tuple[LogEntry, int]]]
     fakeExId: ExId
+    _header: str
+    _dispatch: Tuple[Callable[[ExId, int, Any, int], None], ...]
+    _traced: bool
 
     def __init__(self, cycles: int):
         """Create logger of width."""
         self.cycles = cycles
         self.history: List[LogEntry] = []
         self.current: Dict[ExId, LogEntry] = {}
-        self.cycleMissed = set()
+        self.nopsBefore: Dict[ExId, List[Tuple[LogEntry, int]]] = {}
         self.fakeExId = -1
-    
-    def lookupIndex(self, entry: LogEntry) -> int:
-        """
-        Lookup index of `entry` in history.
-
-        Note that history may be modified (e.g., nop's are inserted).
-        """
-        return len(self.history) - self.history[::-1].index(entry) - 1
+        self._header = 'CPU Cycles ===>     ' + ''.join(f'{i:<4}' for i in range(1, cycles + 1)).rstrip()
+        # Record handlers, indexed by EV_* kind
+        self._dispatch = (
+            self._handleFetch,
+            self._handleStall,
+            self._handleAdvance,
+            self._handleExit,
+            self._handleEndOfCycle,
+        )
+        self._traced = PRINT_EVENTS
     
     def insertNop(self, entry: LogEntry, count: int):
         """Insert `count` nop instructions immediately before `entry`."""
-        index = self.lookupIndex(entry)
-        node = Node(text='nop', inst=MIPSInstruction.NOP, rs=None)
-        nop_entry = LogEntry(self.fakeExId, node, entry.startCycle, self.cycles)
+        nop_entry = LogEntry(self.fakeExId, NOP_NODE, entry.startCycle, self.cycles)
         self.fakeExId -= 1
-        nop_entry.markCycle(entry.startCycle, "IF")
-        nop_entry.markCycle(entry.startCycle + 1, "ID")
-        for _ in range(count):
-            self.history.insert(index, nop_entry)
+        nop_entry.markCycle(entry.startCycle, STAGE_IF)
+        nop_entry.markCycle(entry.startCycle + 1, STAGE_ID)
+        # Spliced into the rows at render time, so history is never shifted
+        self.nopsBefore.setdefault(entry.exId, []).append((nop_entry, count))
         self.current[nop_entry.exId] = nop_entry
-        self.cycleMissed.add(nop_entry)
-
-    def update(self, event: LogEvent) -> None:
-        """Apply effects of event."""
-        if isinstance(event, InstructionFetchEvent):
-            entry = LogEntry(event.exId, event.node, event.cycle, self.cycles)
-            if PRINT_EVENTS:
-                print(f'Instruction fetch {event.exId}')
-            entry.markCycle(event.cycle, 'IF')
-            self.history.append(entry)
-            self.current[event.exId] = entry
-        elif isinstance(event, StageAdvanceEvent):
-            if PRINT_EVENTS:
-                print(f'Stage advance {event.exId} to {event.stage}')
-            entry = self.current[event.exId]
-            self.cycleMissed.discard(entry)
-            entry.markCycle(event.cycle, event.stage)
-        elif isinstance(event, PipelineStallEvent):
-            entry: LogEntry = self.current[event.exId]
-            if PRINT_EVENTS:
-                print(f'Pipeline stall {event.exId} ({entry.node}) with stage {event.stage}')
-            self.cycleMissed.discard(entry)
-            entry.markCycle(event.cycle, event.stage)
-            if event.stalls > 0:
-                self.insertNop(entry, event.stalls)
-        elif isinstance(event, PipelineExitEvent):
-            if PRINT_EVENTS:
-                print(f'Remove {event.exId} from pipeline')
-            entry: LogEntry = self.current.pop(event.exId)
-            self.cycleMissed.discard(entry)
-            entry.bake()
-        elif isinstance(event, EndOfCycleEvent):
-            # Fill asterisk for stages missed
-            if PRINT_EVENTS:
-                print(f'End of cycle {event.cycle}')
-            entry: LogEntry
-            for entry in self.cycleMissed:
-                entry.markCycle(event.cycle, '*')
-                if entry.startCycle <= event.cycle - 4:
-                    #print(f'Bake {entry.exId}')
-                    self.current.pop(entry.exId)
-                    entry.bake()
-                if PRINT_EVENTS:
-                    print(f'\tmark entry {entry.exId} on cycle {event.cycle}')
-            self.cycleMissed = set(self.current.values())
-        else:
+        nop_entry.missed = True
+
+    def rows(self) -> List[LogEntry]:
+        """
+        Get the diagram rows: history, with each execution unit's nop's before it.
+
+        Every row of one nop insert is the same (shared) entry.
+        """
+        nopsBefore = self.nopsBefore
+        if not nopsBefore:
+            return list(self.history)
+        rows: List[LogEntry] = []
+        for entry in self.history:
+            nops = nopsBefore.get(entry.exId)
+            if nops is not None:
+                for nop_entry, count in nops:
+                    rows.extend([nop_entry] * count)
+            rows.append(entry)
+        return rows
+
+    def _handleFetch(self, exId: ExId, cycle: int, node: Node, extra: int) -> None:
+        """Handle EV_FETCH record."""
+        entry = LogEntry(exId, node, cycle, self.cycles)
+        entry.markCycle(cycle, STAGE_IF)
+        self.history.append(entry)
+        self.current[exId] = entry
+    
+    def _handleStall(self, exId: ExId, cycle: int, stage: int, stalls: int) -> None:
+        """Handle EV_STALL record."""
+        entry: LogEntry = self.current[exId]
+        entry.missed = False
+        entry.markCycle(cycle, stage)
+        if stalls > 0:
+            self.insertNop(entry, stalls)
+    
+    def _handleAdvance(self, exId: ExId, cycle: int, stage: int, extra: int) -> None:
+        """Handle EV_ADVANCE record."""
+        entry = self.current[exId]
+        entry.missed = False
+        entry.markCycle(cycle, stage)
+    
+    def _handleExit(self, exId: ExId, cycle: int, arg: Any, extra: int) -> None:
+        """Handle EV_EXIT record."""
+        entry: LogEntry = self.current.pop(exId)
+        entry.bake()
+    
+    def _handleEndOfCycle(self, exId: ExId, cycle: int, arg: Any, extra: int) -> None:
+        """Handle EV_EOC record."""
+        # Fill asterisk for stages missed
+        entry: LogEntry
+        expired: Optional[List[LogEntry]] = None
+        for entry in self.current.values():
+            if entry.missed:
+                entry.markCycle(cycle, STAGE_FLUSH)
+                if entry.startCycle <= cycle - 4:
+                    # Removed after the walk, so current isn't copied every cycle
+                    if expired is None:
+                        expired = []
+                    expired.append(entry)
+                    continue
+            # Every remaining entry has to be marked again next cycle
+            entry.missed = True
+        if expired is not None:
+            for entry in expired:
+                #print(f'Bake {entry.exId}')
+                self.current.pop(entry.exId)
+                entry.bake()
+
+    def _handler(self, kind: int) -> Callable[[ExId, int, Any, int], None]:
+        """Get the handler of a record kind (ValueError if it isn't an EV_* kind)."""
+        dispatch = self._dispatch
+        # Checked explicitly, as a negative kind would otherwise index from the end
+        if type(kind) is not int or not 0 <= kind < len(dispatch):
             raise ValueError("Unknown event type")
+        return dispatch[kind]
+
+    def update(self, record: EventRecord) -> None:
+        """Apply effects of an event record."""
+        if self._traced:
+            self._printRecord(record)
+        kind, exId, cycle, arg, extra = record
+        self._handler(kind)(exId, cycle, arg, extra)
     
+    def updateAll(self, records: Iterable[EventRecord]) -> None:
+        """
+        Apply effects of a batch of event records (e.g., one cycle's worth).
+
+        Equivalent to calling update on each record, but the handler lookup is
+        bound once for the whole batch.
+
+        Parameters
+        ----------
+        records: Iterable[EventRecord]
+            Records to apply, in order
+        
+        """
+        if self._traced:
+            for record in records:
+                self.update(record)
+            return
+        handlerOf = self._handler
+        for kind, exId, cycle, arg, extra in records:
+            handlerOf(kind)(exId, cycle, arg, extra)
+    
+    def _printRecord(self, record: EventRecord) -> None:
+        """Print a description of an event record (before update applies it)."""
+        kind, exId, cycle, arg, extra = record
+        if kind == EV_FETCH:
+            print(f'Instruction fetch {exId}')
+        elif kind == EV_STALL:
+            print(f'Pipeline stall {exId} ({self.current[exId].node}) with stage {STAGE_NAMES[arg]}')
+        elif kind == EV_ADVANCE:
+            print(f'Stage advance {exId} to {STAGE_NAMES[arg]}')
+        elif kind == EV_EXIT:
+            print(f'Remove {exId} from pipeline')
+        elif kind == EV_EOC:
+            print(f'End of cycle {cycle}')
+            for entry in self.current.values():
+                if entry.missed:
+                    print(f'\tmark entry {entry.exId} on cycle {cycle}')
+    
+    def render(self) -> str:
+        """Render pipeline state & history as text (without a trailing newline)."""
+        lines = [self._header]
+        lines.extend(map(str, self.rows()))
+        return '\n'.join(lines)
+
     def print(self) -> None:
         """Print pipeline state & history to stdout."""
-        print('CPU Cycles ===>     ' + ''.join(f'{i:<4}' for i in range(1, self.cycles + 1)).rstrip())
-        for entry in self.history:
-            print(entry)
+        sys.stdout.write(self.render() + '\n')
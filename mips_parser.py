@@ -1,6 +1,5 @@
 """MIPS Assembly parser faculties."""
-import re
-from typing import Match, Pattern, Iterable, Iterator
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from ir import MIPSInstruction, Node, MIPSRegister
 
 
@@ -62,38 +61,19 @@ class Parser(Iterable[Node]):
         'bne': MIPSInstruction.BNE,
     }
 
-    def __init__(self, src: str):
-        self.src = src
-    
-    @property
-    def pattern(self) -> Pattern:
-        """
-        Build parser pattern.
-
-        Pattern provides the following named groups:
-            text
-                Full (raw) text of instruction, not including the label
-            label (optional)
-                Label attached to instruction
-            inst
-                Text of instruction
-            arg1
-                First argument register
-            arg2
-                Second argument register
-            arg3 (optional)
-                Third argument register
-            immediate (optional)
-                Immediate value
-            target (optional)
-                Jump target label
+    def __init__(self, src: Union[str, Iterable[str]]):
         """
-        label_pattern = '\\w+'
-        inst_pattern = '\\w+'
-        reg_pattern = '\\$(?:\\d{1,2}|zero|a[t0-3]|[kv][01]|t[0-9]|s[0-7]|[gsf]p|ra)'
-        immediate_pattern = '\\d+'
-        return re.compile(f'^\\s*(?:(?P<label>{label_pattern}):)?\\s*(?P<text>(?P<inst>{inst_pattern})\\s+(?P<arg1>{reg_pattern})\\s*,\\s*(?P<arg2>{reg_pattern})\\s*,\\s*(?:(?P<arg3>{reg_pattern})|(?P<immediate>{immediate_pattern})|(?P<target>{label_pattern})))\\s*$', flags=re.MULTILINE)
+        Create parser.
 
+        Parameters
+        ----------
+        src: Union[str, Iterable[str]]
+            Source text, or its lines (e.g., an open file, which is then read one line
+            at a time instead of all at once)
+        
+        """
+        self.src = src
+    
     def lookupRegister(self, name: str) -> MIPSRegister:
         #return a register name's enumerated value
         try:
@@ -108,53 +88,174 @@ class Parser(Iterable[Node]):
         except KeyError as e:
             raise ParseError(f"Unknown instruction: '{name}'") from e
     
-    def buildNode(self, match: Match) -> Node:
-        """Build a node from a regex match."""
-        inst = self.lookupInstruction(match['inst'])
+    def buildNode(self, text: str, label: Optional[str], inst: str, arg1: str, arg2: str, arg3: str) -> Node:
+        """
+        Build a node from the tokens of one instruction.
+
+        Parameters
+        ----------
+        text: str
+            Full (raw) text of instruction, not including the label
+        label: str?
+            Label attached to instruction
+        inst: str
+            Text of instruction
+        arg1: str
+            First argument (always a register)
+        arg2: str
+            Second argument (always a register)
+        arg3: str
+            Third argument (register, immediate value, or jump target label)
         
-        # Args 1 & 2 are always registers
-        arg1 = self.lookupRegister(match['arg1'])
-        arg2 = self.lookupRegister(match['arg2'])
-        if inst.isArithmetic:
-            arg3 = self.lookupRegister(match['arg3'])
-            return Node(
-                text=match['text'],
-                label=match['label'],
-                inst=inst,
-                rd=arg1,
-                rs=arg2,
-                rt=arg3
-            )
-        elif inst.isImmediate:
-            try:
-                immediate = int(match['immediate'])
-            except ValueError as e:
-                raise ParseError(f"Unable to parse immediate (value: {match['immediate']})") from e
-
-            return Node(
-                text=match['text'],
-                label=match['label'],
-                inst=inst,
-                rd=arg1,
-                rs=arg2,
-                immediate=immediate
-            )
-        elif inst.isBranch:
-            target = match['target']
-            if target is None:
-                raise ValueError("Missing target in instruction '{match['text']}'")
-            return Node(
-                text=match['text'],
-                label=match['label'],
-                inst=inst,
-                rs=arg1,
-                rt=arg2,
-                target=target
-            )
-        else:
-            raise ValueError(f'Unexpected instruction: {inst}')
+        """
+        code = Parser._INSTRUCTION_LUT.get(inst)
+        if code is None:
+            code = self.lookupInstruction(inst)
+        build = _BUILDERS[code]
+        if build is None:
+            raise ValueError(f'Unexpected instruction: {code}')
+        
+        # Args 1 & 2 are always registers (read straight from the LUT; lookupRegister
+        # only runs to report an unknown one)
+        registers = Parser._REGISTER_LUT
+        rArg1 = registers.get(arg1)
+        if rArg1 is None:
+            rArg1 = self.lookupRegister(arg1)
+        rArg2 = registers.get(arg2)
+        if rArg2 is None:
+            rArg2 = self.lookupRegister(arg2)
+        return build(self, text, label, code, rArg1, rArg2, arg3)
+
+    def parse(self) -> List[Node]:
+        """
+        Parse the whole source.
+
+        Each line holds one `[label:] inst arg1,arg2,arg3` instruction, optionally
+        followed by a `#` comment. A label alone on its line is attached to the
+        instruction on the next non-blank line, and lines that aren't shaped like an
+        instruction are skipped.
+
+        Returns
+        -------
+        List[Node]
+            Parsed instructions, in source order
+        
+        """
+        nodes: List[Node] = []
+        # Bound once, so the loop does no attribute or global lookups for them
+        append = nodes.append
+        build = self.buildNode
+        tokenize = _tokenize
+        isWord = _isWord
+        label = None
+        src = self.src
+        for line in (src.split('\n') if isinstance(src, str) else src):
+            if '#' in line:
+                # Strip comment
+                line = line[:line.index('#')]
+            text = line.strip()
+            if not text:
+                continue
+            head, colon, rest = text.partition(':')
+            if colon and isWord(head):
+                label = head
+                text = rest.lstrip()
+                if not text:
+                    # Label on its own line
+                    continue
+            tokens = tokenize(text)
+            if tokens is not None:
+                append(build(text, label, *tokens))
+            label = None
+        return nodes
 
     def __iter__(self) -> Iterator[Node]:
-        """Node iterator."""
-        for match in re.finditer(self.pattern, self.src):
-            yield self.buildNode(match)
+        """Node iterator (see parse)."""
+        return iter(self.parse())
+
+
+# Values of immediate tokens already seen (bounded; only valid tokens are stored)
+_IMMEDIATE_CACHE: Dict[str, int] = {}
+_IMMEDIATE_CACHE_SIZE = 4096
+
+
+def _buildArithmetic(parser: Parser, text: str, label: Optional[str], inst: MIPSInstruction, rArg1: MIPSRegister, rArg2: MIPSRegister, arg3: str) -> Node:
+    #build `INST rd,rs,rt`
+    rArg3 = Parser._REGISTER_LUT.get(arg3)
+    if rArg3 is None:
+        rArg3 = parser.lookupRegister(arg3)
+    return Node(
+        text=text,
+        label=label,
+        inst=inst,
+        rd=rArg1,
+        rs=rArg2,
+        rt=rArg3
+    )
+
+
+def _buildImmediate(parser: Parser, text: str, label: Optional[str], inst: MIPSInstruction, rArg1: MIPSRegister, rArg2: MIPSRegister, arg3: str) -> Node:
+    #build `INST rd,rs,imm`
+    immediate = _IMMEDIATE_CACHE.get(arg3)
+    if immediate is None:
+        if not arg3.isdecimal():
+            raise ParseError(f"Unable to parse immediate (value: {arg3})")
+        immediate = int(arg3)
+        if len(_IMMEDIATE_CACHE) < _IMMEDIATE_CACHE_SIZE:
+            _IMMEDIATE_CACHE[arg3] = immediate
+    return Node(
+        text=text,
+        label=label,
+        inst=inst,
+        rd=rArg1,
+        rs=rArg2,
+        immediate=immediate
+    )
+
+
+def _buildBranch(parser: Parser, text: str, label: Optional[str], inst: MIPSInstruction, rArg1: MIPSRegister, rArg2: MIPSRegister, arg3: str) -> Node:
+    #build `INST rs,rt,target`
+    if arg3.isdecimal() or arg3.startswith('$'):
+        raise ParseError(f"Missing target in instruction '{text}'")
+    return Node(
+        text=text,
+        label=label,
+        inst=inst,
+        rs=rArg1,
+        rt=rArg2,
+        target=arg3
+    )
+
+
+# Node builder of each instruction, indexed by MIPSInstruction (None if it can't be parsed)
+_BUILDERS = tuple(
+    _buildArithmetic if inst.isArithmetic
+    else _buildImmediate if inst.isImmediate
+    else _buildBranch if inst.isBranch
+    else None
+    for inst in MIPSInstruction
+)
+
+
+def _isWord(token: str) -> bool:
+    #if token is a non-empty run of word characters (letters, digits, underscore)
+    return token.replace('_', 'a').isalnum()
+
+
+def _isRegister(token: str) -> bool:
+    #if token is shaped like a register (it may still be unknown, e.g. `$5`)
+    return token in Parser._REGISTER_LUT or (token[:1] == '$' and 2 <= len(token) <= 3 and token[1:].isdecimal())
+
+
+def _tokenize(text: str) -> Optional[Tuple[str, str, str, str]]:
+    #split `inst arg1,arg2,arg3` into its tokens (None if text isn't shaped like that)
+    parts = text.split(None, 1)
+    if len(parts) != 2 or (parts[0] not in Parser._INSTRUCTION_LUT and not _isWord(parts[0])):
+        return None
+    args = parts[1].split(',', 2)
+    if len(args) != 3:
+        return None
+    arg1, arg2, arg3 = args[0].strip(), args[1].strip(), args[2].strip()
+    if not (_isRegister(arg1) and _isRegister(arg2) and (_isRegister(arg3) or _isWord(arg3))):
+        return None
+    return parts[0], arg1, arg2, arg3
@@ -1,6 +1,5 @@
 import sys
 import itertools
-from utils import grouped
 from ir import MIPSRegister
 from mips_parser import Parser
 from cpu import CPU
@@ -8,33 +7,36 @@ from logger import Logger
 
 MAX_CYCLES = 16
 
+# Registers shown in the state table, in display order
+SHOWN_REGISTERS = tuple(map(
+    MIPSRegister,
+    itertools.chain(
+        range(MIPSRegister.S0, MIPSRegister.S7 + 1),
+        range(MIPSRegister.T0, MIPSRegister.T7 + 1),
+        range(MIPSRegister.T8, MIPSRegister.T9 + 1),
+    )
+))
+
 
 def printState(cpu: CPU, logger: Logger) -> None:
     """Print CPU state."""
 
-    logger.print()
+    # Whole frame (pipeline diagram, blank line, register table) goes out in one write
+    lines = [logger.render(), '']
 
-    print()
-
-    # Print table of selected registers
-    regs = map(
-        MIPSRegister,
-        itertools.chain(
-            range(MIPSRegister.S0, MIPSRegister.S7 + 1),
-            range(MIPSRegister.T0, MIPSRegister.T7 + 1),
-            range(MIPSRegister.T8, MIPSRegister.T9 + 1),
-        )
-    )
-    cells = map(lambda reg: f'{reg!s} = {cpu.register(reg)}', regs)
-    for row in grouped(4, cells):
-        print(''.join(f'{cell:<20}' for cell in row).rstrip())
+    # Table of selected registers
+    register = cpu.register
+    cells = [f'{reg!s} = {register(reg)}' for reg in SHOWN_REGISTERS]
+    for i in range(0, len(cells), 4):
+        lines.append(''.join(f'{cell:<20}' for cell in cells[i:i + 4]).rstrip())
+    lines.append('')
+    sys.stdout.write('\n'.join(lines))
 
 
 def main(forwarding: bool, srcFile: str) -> None:
+    # Parse (streaming the file line by line)
     with open(srcFile, 'r') as f:
-        src = f.read()
-    # Parse
-    nodes = [node for node in Parser(src)]
+        nodes = Parser(f).parse()
     # Run the thing
     cpu = CPU(nodes, forwarding=forwarding)
     logger = Logger(MAX_CYCLES)
@@ -42,8 +44,7 @@ def main(forwarding: bool, srcFile: str) -> None:
     i = 0
     while cpu.running and i < MAX_CYCLES:
         print('-' * 82)
-        for event in cpu.cycle():
-            logger.update(event)
+        logger.updateAll(cpu.cycle())
         printState(cpu, logger)
         i += 1
     print('-' * 82)
@@ -55,7 +56,8 @@ if __name__ == '__main__':
         print('Usage: automatic-carnival [f/n] [src]')
         exit(-1)
 
-    if sys.argv[1] not in ('F', 'N'):
-        print(f"Error: Forwarding mode must be either 'F' or 'N' (actual: '{sys.argv[1]}')")
+    mode = sys.argv[1]
+    if mode not in ('F', 'N'):
+        print(f"Error: Forwarding mode must be either 'F' or 'N' (actual: '{mode}')")
         exit(-1)
-    main(sys.argv[1] == 'F', sys.argv[2])
\ No newline at end of file
+    main(mode == 'F', sys.argv[2])
\ No newline at end of file